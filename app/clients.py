@@ -0,0 +1,51 @@
+# app/clients.py
+
+import asyncio
+import os
+
+import httpx
+from openai import AsyncOpenAI
+
+
+# --------- Shared OpenAI Client ---------
+"""
+One AsyncOpenAI client for the whole app.
+
+Every agent imports `openai_client` from here instead of building its own, so
+all OpenAI traffic shares a single keep-alive (HTTP/2) connection pool rather
+than paying TCP/TLS setup per module under load.
+
+Timeouts are deliberately tight: a hung OpenAI call should fail (and be
+retried by the SDK) rather than hold a request open indefinitely. Calls go
+through `openai_semaphore` so a saturated upstream can't pile up an unbounded
+number of in-flight requests.
+"""
+
+OPENAI_TIMEOUT = httpx.Timeout(connect=3.0, read=20.0, write=5.0, pool=1.0)
+OPENAI_MAX_RETRIES = 2
+# Per worker process: with WEB_CONCURRENCY=N the real ceiling is N x this.
+OPENAI_MAX_CONCURRENCY = 100
+
+
+def _get_openai_client() -> AsyncOpenAI:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set in environment variables")
+
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        timeout=OPENAI_TIMEOUT,
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=OPENAI_TIMEOUT,
+        max_retries=OPENAI_MAX_RETRIES,
+    )
+
+
+openai_client = _get_openai_client()
+
+# Wrap every openai_client call: `async with openai_semaphore: ...`
+openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
@@ -1,49 +1,137 @@
 # app/tasks/analysis/intent_router.py
 
-import os
-import json
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
 from enum import Enum
-from typing import Literal, Optional
+from typing import Annotated, Dict, Literal, Optional
 
-from pydantic import BaseModel, field_validator
+import msgspec
 from fastapi import HTTPException
-from openai import OpenAI
 
+from app.clients import openai_client, openai_semaphore
 
-def _get_openai_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set in environment variables")
-    return OpenAI(api_key=api_key)
 
-
-client = _get_openai_client()
-
-
-class IntentLabel(str, Enum):
+class IntentLabel(Enum):
     CHAT = "chat"                # general Q&A / explanation
     SEARCH_BUILDER = "search_builder"  # user wants a saved search built
 
 
-class IntentResult(BaseModel):
+class IntentResult(msgspec.Struct):
     intent: IntentLabel
-    confidence: float
+    # Range is checked by msgspec while decoding
+    confidence: Annotated[float, msgspec.Meta(ge=0.0, le=1.0)]
     reasoning: Optional[str] = None
 
-    @field_validator("confidence")
-    @classmethod
-    def validate_confidence(cls, v: float) -> float:
-        if not (0.0 <= v <= 1.0):
-            raise ValueError("confidence must be between 0 and 1")
-        return v
 
-
-def detect_intent(prompt: str) -> IntentResult:
+# --------- Heuristic Pre-Router ---------
+# Obvious prompts ("show me all open POs", "hello") don't need an LLM call to
+# classify. Anything these patterns don't clearly match goes to the LLM.
+
+# Shortcut only when a record noun is the direct object of an imperative
+# listing verb, with at most a determiner / status word in between, e.g.
+# "show me all open POs over 50k", "please find sales orders from last week".
+# Anything looser ("list the steps to create a purchase order", "show my
+# sales quota") goes to the LLM. Examples are pinned in test_intent_router.py.
+_SEARCH_RE = re.compile(
+    r"^\s*(please\s+|can\s+you\s+|could\s+you\s+)?(show|find|list|pull)\s+"
+    r"(me\s+)?(all\s+|the\s+|my\s+)?(open\s+|closed\s+|pending\s+)?"
+    r"(purchase\s+orders?|sales\s+orders?|pos?|invoices?|transactions?)\b",
+    re.IGNORECASE,
+)
+# Anything that asks for an explanation goes to the LLM, even if it also
+# matches the search pattern above.
+_DEFER_RE = re.compile(r"\b(explain|why|how|about|tell me)\b", re.IGNORECASE)
+# Bare greetings / thanks -> chat
+_CHAT_RE = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening))\b[\s!.,]*$",
+    re.IGNORECASE,
+)
+
+_HEURISTIC_SEARCH = IntentResult(
+    intent=IntentLabel.SEARCH_BUILDER, confidence=0.92, reasoning="keyword match"
+)
+_HEURISTIC_CHAT = IntentResult(
+    intent=IntentLabel.CHAT, confidence=0.95, reasoning="greeting / small talk"
+)
+
+
+def _match_heuristic(prompt: str) -> Optional[IntentResult]:
+    if _CHAT_RE.match(prompt):
+        return _HEURISTIC_CHAT
+    if _SEARCH_RE.match(prompt) and not _DEFER_RE.search(prompt):
+        return _HEURISTIC_SEARCH
+    return None
+
+
+# --------- Intent Cache ---------
+# Users (and retries) send the same prompt over and over; the classification
+# doesn't change, so keep recent results in-process and skip the LLM call.
+
+_INTENT_CACHE_MAXSIZE = 4096
+_intent_cache: "OrderedDict[bytes, IntentResult]" = OrderedDict()
+
+# Identical prompts that arrive while the first one is still being classified
+# (bursts, client retries) wait on that same call instead of starting their own.
+_inflight: "Dict[bytes, asyncio.Task[IntentResult]]" = {}
+
+
+def _cache_key(prompt: str) -> bytes:
+    # Fixed-size digest of the normalized prompt, so cached / in-flight entries
+    # never pin arbitrarily large prompt strings in memory.
+    return hashlib.blake2b(prompt.strip().lower().encode(), digest_size=16).digest()
+
+
+async def detect_intent(prompt: str) -> IntentResult:
     """
     Lightweight router:
     - Takes natural-language prompt.
     - Returns { intent: 'chat' | 'search_builder', confidence, reasoning }.
+    - Repeated prompts are answered from an in-process LRU cache, and
+      concurrent identical prompts share a single in-flight LLM call.
+    - Obvious prompts are classified by keyword, skipping the LLM entirely.
     """
+    heuristic = _match_heuristic(prompt)
+    if heuristic is not None:
+        return heuristic
+
+    key = _cache_key(prompt)
+
+    cached = _intent_cache.get(key)
+    if cached is not None:
+        _intent_cache.move_to_end(key)
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_classify_and_cache(key, prompt))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget_inflight(key, t))
+
+    # Shielded so one waiter being cancelled (client disconnect, a cancelled
+    # speculative request) doesn't cancel the call the others are sharing.
+    return await asyncio.shield(task)
+
+
+def _forget_inflight(key: bytes, task: "asyncio.Task[IntentResult]") -> None:
+    _inflight.pop(key, None)
+    # Mark any error as retrieved in case every waiter had already gone away.
+    if not task.cancelled():
+        task.exception()
+
+
+async def _classify_and_cache(key: bytes, prompt: str) -> IntentResult:
+    result = await _classify_with_llm(prompt)
+
+    _intent_cache[key] = result
+    if len(_intent_cache) > _INTENT_CACHE_MAXSIZE:
+        _intent_cache.popitem(last=False)
+
+    return result
+
+
+async def _classify_with_llm(prompt: str) -> IntentResult:
 
     system_instructions = (
         "You are Feasure's intent router. Your job is to classify what the user wants "
@@ -66,27 +154,27 @@ def detect_intent(prompt: str) -> IntentResult:
     )
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_instructions},
-                {"role": "user", "content": prompt},
-            ],
-        )
+        async with openai_semaphore:
+            completion = await openai_client.chat.completions.create(
+                model="gpt-4.1-mini",
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": system_instructions},
+                    {"role": "user", "content": prompt},
+                ],
+            )
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Intent LLM call failed: {e}")
 
     raw_json = completion.choices[0].message.content
 
+    # Parse + validate in one msgspec pass.
+    # ValidationError subclasses DecodeError, so it has to be caught first.
     try:
-        data = json.loads(raw_json)
+        result = msgspec.json.decode(raw_json, type=IntentResult)
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Intent validation failed: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Invalid JSON from intent model: {e}")
 
-    try:
-        result = IntentResult.model_validate(data)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Intent validation failed: {e}")
-
     return result
@@ -0,0 +1,59 @@
+# app/tasks/intent/test_intent_router.py
+
+import os
+
+import pytest
+
+# app.clients builds the OpenAI client at import time; no calls are made here.
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.tasks.intent.intent_router import IntentLabel, _match_heuristic  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "show me all open POs over 50k",
+        "show me all open purchase orders over 50k",
+        "please find sales orders from last week",
+        "can you list invoices by customer",
+        "pull the pending purchase orders for Acme",
+    ],
+)
+def test_search_shortcut(prompt):
+    result = _match_heuristic(prompt)
+    assert result is not None
+    assert result.intent is IntentLabel.SEARCH_BUILDER
+
+
+@pytest.mark.parametrize("prompt", ["hello", "Hi!", "thanks", "good morning"])
+def test_greeting_shortcut(prompt):
+    result = _match_heuristic(prompt)
+    assert result is not None
+    assert result.intent is IntentLabel.CHAT
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        # Chat questions that mention records must reach the LLM.
+        "Can you explain all the sales order statuses?",
+        "Tell me all about sales tax",
+        "explain why my report of invoices fails",
+        "all good, thanks for the orders info",
+        "how do I find a purchase order?",
+        "what is a saved search?",
+        "list the steps to create a purchase order",
+        "build a workflow for purchase order approvals",
+        "show me what a sales order looks like",
+        "list the differences between sales orders and purchase orders",
+        "show my sales quota",
+        "filter out spam from my sales emails",
+        "show me posters",
+        # Ambiguous enough that the LLM should decide.
+        "build a report of invoices by customer",
+        "hi, show me all open POs",
+    ],
+)
+def test_falls_through_to_llm(prompt):
+    assert _match_heuristic(prompt) is None
@@ -1,24 +1,11 @@
 # app/tasks/search/search_agent.py
 
-import os
-import json
-from typing import Any, Dict, List, Literal, Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional, get_args
 
-from pydantic import BaseModel, field_validator
+import msgspec
 from fastapi import HTTPException
-from openai import OpenAI
 
-
-# --------- OpenAI Client Setup ---------
-
-def _get_openai_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set in environment variables")
-    return OpenAI(api_key=api_key)
-
-
-client = _get_openai_client()
+from app.clients import openai_client, openai_semaphore
 
 
 # --------- Feasure Search Library (MVP) ---------
@@ -75,9 +62,10 @@ FEASURE_SEARCH_LIBRARY: Dict[str, Any] = {
 }
 
 
-# --------- Pydantic Models ---------
+# --------- Models ---------
 
-ALLOWED_RECORD_TYPES = {"purchaseorder", "salesorder", "transaction"}
+RecordType = Literal["purchaseorder", "salesorder", "transaction"]
+ALLOWED_RECORD_TYPES = set(get_args(RecordType))
 
 # Allowed operators in filters (MVP list; extend as needed)
 ALLOWED_OPERATORS = {
@@ -94,92 +82,129 @@ ALLOWED_OPERATORS = {
     "on",
 }
 
+# Field IDs allowed in columns / filters (hoisted so it isn't rebuilt per call)
+_ALLOWED_FIELDS = frozenset(FEASURE_SEARCH_LIBRARY["fields"]["transaction"])
+
 
-class SearchSpec(BaseModel):
+class SearchSpec(msgspec.Struct):
     """
     JSON spec that Feasure will accept to create a NetSuite saved search.
     This is intentionally close to NetSuite's search.create API.
+    Shape constraints are declared on the fields so msgspec enforces them
+    inside its decode pass; the library checks run in __post_init__, which
+    msgspec calls as part of the same decode.
     """
     action: Literal["create_saved_search"]
-    recordType: str               # e.g. "purchaseorder"
+    recordType: RecordType        # e.g. "purchaseorder"
     searchTitle: str              # title used when saving the search
-    filters: List[Any]            # NetSuite-style filters array (triplets + "AND"/"OR")
-    columns: List[str]            # list of field IDs for columns
-
-    @field_validator("recordType")
-    @classmethod
-    def validate_record_type(cls, v: str) -> str:
-        if v not in ALLOWED_RECORD_TYPES:
-            raise ValueError(f"recordType '{v}' is not allowed")
-        return v
-
-    @field_validator("filters")
-    @classmethod
-    def validate_filters_not_empty(cls, v: List[Any]) -> List[Any]:
-        if not v:
-            raise ValueError("filters cannot be empty for saved search")
-        return v
-
-    @field_validator("columns")
-    @classmethod
-    def validate_columns_not_empty(cls, v: List[str]) -> List[str]:
-        if not v:
-            raise ValueError("columns cannot be empty for saved search")
-        return v
-
-
-class SearchBuilderResult(BaseModel):
+    # NetSuite-style filters array (triplets + "AND"/"OR"); cannot be empty
+    filters: Annotated[List[Any], msgspec.Meta(min_length=1)]
+    # list of field IDs for columns; cannot be empty
+    columns: Annotated[List[str], msgspec.Meta(min_length=1)]
+
+    def __post_init__(self) -> None:
+        """
+        Extra semantic validation against Feasure's library:
+        - Columns must be in Feasure's known field list.
+        - Filter field IDs must be known (except special ones like 'type').
+        - Operators must come from an allow-list.
+        A ValueError here surfaces as msgspec.ValidationError from decode.
+        """
+        for col in self.columns:
+            if col not in _ALLOWED_FIELDS:
+                raise ValueError(f"Column '{col}' is not allowed / not in Feasure library")
+
+        for part in self.filters:
+            if isinstance(part, list) and len(part) >= 3:
+                field_id, operator = part[0], part[1]
+
+                # Allow 'type' as a special field even if not in fields list
+                if field_id not in _ALLOWED_FIELDS and field_id != "type":
+                    raise ValueError(
+                        f"Filter field '{field_id}' is not allowed / not in Feasure library"
+                    )
+
+                if operator not in ALLOWED_OPERATORS:
+                    raise ValueError(f"Filter operator '{operator}' is not allowed")
+
+
+class SearchBuilderResult(msgspec.Struct):
     mode: Literal["search_builder"]
     search_spec: SearchSpec
     explanation: Optional[str] = None
 
 
-# --------- Extra Safety: Validate Against Library ---------
-
-def _validate_against_library(spec: SearchSpec) -> None:
-    """
-    Extra semantic validation beyond basic schema:
-    - Columns must be in Feasure's known field list.
-    - Filter field IDs must be known (except special ones like 'type').
-    - Operators must come from an allow-list.
-    """
-    allowed_fields = set(FEASURE_SEARCH_LIBRARY["fields"]["transaction"])
-
-    # 1) Validate columns
-    for col in spec.columns:
-        if col not in allowed_fields:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Column '{col}' is not allowed / not in Feasure library",
-            )
-
-    # 2) Validate filters
-    i = 0
-    while i < len(spec.filters):
-        part = spec.filters[i]
-        if isinstance(part, list) and len(part) >= 3:
-            field_id = part[0]
-            operator = part[1]
-
-            # Allow 'type' as a special field even if not in fields list
-            if field_id not in allowed_fields and field_id != "type":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Filter field '{field_id}' is not allowed / not in Feasure library",
-                )
-
-            if operator not in ALLOWED_OPERATORS:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Filter operator '{operator}' is not allowed",
-                )
-
-        i += 1
+# --------- System Prompt ---------
+# Built once at import: FEASURE_SEARCH_LIBRARY is static, so there's no reason
+# to re-serialize it and rebuild this string on every request.
+#
+# Keep this prompt byte-identical across requests (nothing per-request goes
+# in it; the user prompt is always the last message) so OpenAI's prompt
+# caching can serve the prefix from cache. Caching only applies to prefixes
+# of 1024+ tokens -- today this is ~600, so it starts paying off as the
+# library grows. _PROMPT_CACHE_KEY routes these requests to the same cache.
+
+# Minimal JSON representation of the library for the model
+# (kept small so we don't blow up context).
+_LIBRARY_JSON = msgspec.json.format(
+    msgspec.json.encode(
+        {
+            "recordTypes": FEASURE_SEARCH_LIBRARY["recordTypes"],
+            "transactionTypes": FEASURE_SEARCH_LIBRARY["transactionTypes"],
+            "fields": FEASURE_SEARCH_LIBRARY["fields"],
+            "purchaseorderStatus": FEASURE_SEARCH_LIBRARY["purchaseorderStatus"],
+            "datePlaceholders": FEASURE_SEARCH_LIBRARY["datePlaceholders"],
+        }
+    ),
+    indent=2,
+).decode()
+
+_SYSTEM_INSTRUCTIONS = (
+    "You are Feasure, an AI assistant that designs NetSuite saved searches.\n"
+    "Your job is to analyze the user's natural-language request and output a JSON object "
+    "that describes a NetSuite saved search to create.\n\n"
+    "You have access to the following NetSuite vocabulary (field IDs, record types, etc.):\n"
+    f"{_LIBRARY_JSON}\n\n"
+    "CRITICAL RULES:\n"
+    "1. Output ONLY a single JSON object, no commentary, no markdown.\n"
+    "2. The JSON MUST conform to this structure:\n"
+    "{\n"
+    '  \"mode\": \"search_builder\",\n'
+    "  \"search_spec\": {\n"
+    '    \"action\": \"create_saved_search\",\n'
+    '    \"recordType\": \"purchaseorder\" | \"salesorder\" | \"transaction\",\n'
+    '    \"searchTitle\": \"<short human-readable title>\",\n'
+    "    \"filters\": [\n"
+    "       // NetSuite-style filters, for example:\n"
+    "       [\"type\", \"anyof\", \"PurchOrd\"],\n"
+    "       \"AND\",\n"
+    "       [\"status\", \"anyof\", \"PurchOrd:A\"],\n"
+    "       \"AND\",\n"
+    "       [\"amount\", \"greaterthan\", \"50000\"],\n"
+    "       \"AND\",\n"
+    "       [\"trandate\", \"onorafter\", \"daysago30\"]\n"
+    "    ],\n"
+    "    \"columns\": [\"tranid\", \"entity\", \"amount\", \"status\", \"trandate\"]\n"
+    "  },\n"
+    "  \"explanation\": \"Short human-readable explanation of the search, in plain English.\"\n"
+    "}\n\n"
+    "3. Do NOT invent record types beyond the allowed list.\n"
+    "4. Use the field IDs and status IDs from the vocabulary when possible.\n"
+    "5. Use reasonable default columns so the search is immediately useful.\n"
+    "6. When the user does not specify exact amounts or date ranges, infer sensible defaults.\n"
+    "7. For date filters, ALWAYS use NetSuite-relative date keywords directly as values, "
+    "   such as \"daysago7\", \"daysago30\", \"daysago90\", \"today\", \"yesterday\", "
+    "   \"thismonth\", or \"lastmonth\". For example, for \"last 30 days\" use:\n"
+    "   [\"trandate\", \"onorafter\", \"daysago30\"].\n"
+    "8. Never return JavaScript or any code, only the JSON object described above.\n"
+)
+
+_PROMPT_CACHE_KEY = "feasure-search-agent"
 
 
 # --------- Core Agent Function ---------
 
-def build_search_from_prompt(prompt: str) -> SearchBuilderResult:
+async def build_search_from_prompt(prompt: str) -> SearchBuilderResult:
     """
     Core 'search agent' function.
     - Takes a natural-language prompt from a NetSuite user.
@@ -187,89 +212,34 @@ def build_search_from_prompt(prompt: str) -> SearchBuilderResult:
     - Enforces strict JSON structure and allowed record types.
     """
 
-    # Minimal JSON representation of the library for the model
-    # (kept small so we don't blow up context).
-    library_json = json.dumps(
-        {
-            "recordTypes": FEASURE_SEARCH_LIBRARY["recordTypes"],
-            "transactionTypes": FEASURE_SEARCH_LIBRARY["transactionTypes"],
-            "fields": FEASURE_SEARCH_LIBRARY["fields"],
-            "purchaseorderStatus": FEASURE_SEARCH_LIBRARY["purchaseorderStatus"],
-            "datePlaceholders": FEASURE_SEARCH_LIBRARY["datePlaceholders"],
-        },
-        indent=2,
-    )
-
-    system_instructions = (
-        "You are Feasure, an AI assistant that designs NetSuite saved searches.\n"
-        "Your job is to analyze the user's natural-language request and output a JSON object "
-        "that describes a NetSuite saved search to create.\n\n"
-        "You have access to the following NetSuite vocabulary (field IDs, record types, etc.):\n"
-        f"{library_json}\n\n"
-        "CRITICAL RULES:\n"
-        "1. Output ONLY a single JSON object, no commentary, no markdown.\n"
-        "2. The JSON MUST conform to this structure:\n"
-        "{\n"
-        '  \"mode\": \"search_builder\",\n'
-        "  \"search_spec\": {\n"
-        '    \"action\": \"create_saved_search\",\n'
-        '    \"recordType\": \"purchaseorder\" | \"salesorder\" | \"transaction\",\n'
-        '    \"searchTitle\": \"<short human-readable title>\",\n'
-        "    \"filters\": [\n"
-        "       // NetSuite-style filters, for example:\n"
-        "       [\"type\", \"anyof\", \"PurchOrd\"],\n"
-        "       \"AND\",\n"
-        "       [\"status\", \"anyof\", \"PurchOrd:A\"],\n"
-        "       \"AND\",\n"
-        "       [\"amount\", \"greaterthan\", \"50000\"],\n"
-        "       \"AND\",\n"
-        "       [\"trandate\", \"onorafter\", \"daysago30\"]\n"
-        "    ],\n"
-        "    \"columns\": [\"tranid\", \"entity\", \"amount\", \"status\", \"trandate\"]\n"
-        "  },\n"
-        "  \"explanation\": \"Short human-readable explanation of the search, in plain English.\"\n"
-        "}\n\n"
-        "3. Do NOT invent record types beyond the allowed list.\n"
-        "4. Use the field IDs and status IDs from the vocabulary when possible.\n"
-        "5. Use reasonable default columns so the search is immediately useful.\n"
-        "6. When the user does not specify exact amounts or date ranges, infer sensible defaults.\n"
-        "7. For date filters, ALWAYS use NetSuite-relative date keywords directly as values, "
-        "   such as \"daysago7\", \"daysago30\", \"daysago90\", \"today\", \"yesterday\", "
-        "   \"thismonth\", or \"lastmonth\". For example, for \"last 30 days\" use:\n"
-        "   [\"trandate\", \"onorafter\", \"daysago30\"].\n"
-        "8. Never return JavaScript or any code, only the JSON object described above.\n"
-    )
-
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_instructions},
-                {"role": "user", "content": prompt},
-            ],
-        )
+        async with openai_semaphore:
+            completion = await openai_client.chat.completions.create(
+                model="gpt-4.1-mini",
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": _SYSTEM_INSTRUCTIONS},
+                    {"role": "user", "content": prompt},
+                ],
+                prompt_cache_key=_PROMPT_CACHE_KEY,
+            )
     except Exception as e:
         # This error means the OpenAI call itself failed.
         raise HTTPException(status_code=502, detail=f"LLM call failed: {e}")
 
     raw_json = completion.choices[0].message.content
 
+    # Parse + validate (schema and library checks) in one msgspec pass.
+    # ValidationError subclasses DecodeError, so it has to be caught first.
     try:
-        data = json.loads(raw_json)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON from model: {e}")
-
-    try:
-        result = SearchBuilderResult.model_validate(data)
-    except Exception as e:
+        result = msgspec.json.decode(raw_json, type=SearchBuilderResult)
+    except msgspec.ValidationError as e:
         # The model returned JSON, but it didn't match our schema.
         raise HTTPException(
             status_code=400,
             detail=f"Search spec validation failed: {e}"
         )
-
-    # Extra semantic validation against Feasure's library
-    _validate_against_library(result.search_spec)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Invalid JSON from model: {e}")
 
     return result
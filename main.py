@@ -1,12 +1,18 @@
 # main.py
 
+import asyncio
 import os
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional
 
+import msgspec
+import uvicorn
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from openai import OpenAI
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, WithJsonSchema
+from starlette.background import BackgroundTask
 
+from app.clients import openai_client, openai_semaphore
 from app.tasks.intent.intent_router import (
     detect_intent,
     IntentLabel,
@@ -18,13 +24,14 @@ from app.tasks.search.search_agent import (
 )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the shared OpenAI connection pool on shutdown.
+    await openai_client.close()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY is not set in environment variables")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+app = FastAPI(lifespan=lifespan)
 
 
 # ---------- Models ----------
@@ -33,85 +40,258 @@ class AIRequest(BaseModel):
     prompt: str
     # Optional override: for testing you can force a mode
     force_mode: Optional[str] = None
+    # Stream chat replies as server-sent events instead of one JSON body.
+    # Opt-in, since existing NetSuite callers JSON.parse the response.
+    stream: bool = False
+
+
+# Upper bound on prompts per /ai/batch call; larger requests are rejected
+# with 422 rather than allocating a task per prompt up front.
+MAX_BATCH_PROMPTS = 100
+
+
+class AIBatchRequest(BaseModel):
+    prompts: List[str] = Field(max_length=MAX_BATCH_PROMPTS)
+    force_mode: Optional[str] = None
+
+
+# SearchSpec is a msgspec.Struct, which Pydantic can't document on its own;
+# reuse msgspec's JSON schema for it so /openapi.json keeps the typed contract.
+_SEARCH_SPEC_SCHEMA = {
+    **msgspec.json.schema_components([SearchSpec])[1]["SearchSpec"],
+    "description": "NetSuite saved search spec (close to search.create).",
+}
 
 
 class AIResponse(BaseModel):
     mode: str
     reply: Optional[str] = None
-    search_spec: Optional[SearchSpec] = None
+    # Already validated on decode; passed through here as plain JSON builtins.
+    search_spec: Annotated[
+        Optional[Dict[str, Any]],
+        WithJsonSchema({"anyOf": [_SEARCH_SPEC_SCHEMA, {"type": "null"}]}),
+    ] = None
     explanation: Optional[str] = None
     intent_confidence: Optional[float] = None
 
 
+_AI_RESPONSE_LIST = TypeAdapter(List[AIResponse])
+
+
 # ---------- Chat helper ----------
 
-def call_llm_for_chat(prompt: str) -> str:
-    completion = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are Feasure, an AI assistant that helps with ERP and NetSuite tasks. "
-                    "Answer clearly and concisely."
-                ),
-            },
-            {"role": "user", "content": prompt},
-        ],
-    )
+# Module-level and byte-identical on every call so it's always a stable
+# prompt prefix (see _CHAT_PROMPT_CACHE_KEY).
+_CHAT_SYSTEM = (
+    "You are Feasure, an AI assistant that helps with ERP and NetSuite tasks. "
+    "Answer clearly and concisely."
+)
+_CHAT_SYSTEM_MESSAGE = {"role": "system", "content": _CHAT_SYSTEM}
+_CHAT_PROMPT_CACHE_KEY = "feasure-chat"
+
+
+def _chat_messages(prompt: str) -> List[Dict[str, str]]:
+    return [_CHAT_SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
+
+
+async def call_llm_for_chat(prompt: str) -> str:
+    async with openai_semaphore:
+        completion = await openai_client.chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=_chat_messages(prompt),
+            prompt_cache_key=_CHAT_PROMPT_CACHE_KEY,
+        )
     return completion.choices[0].message.content
 
 
+async def call_llm_for_chat_stream(prompt: str) -> StreamingResponse:
+    """
+    Streaming variant of call_llm_for_chat.
+    The OpenAI request is opened before returning, so connection/API errors
+    still surface as normal HTTP errors; the returned response then streams
+    SSE events ("data: <json string delta>") followed by "data: [DONE]".
+    The concurrency semaphore only covers opening the stream, so the upstream
+    stream is closed explicitly: when the body finishes or is abandoned
+    mid-stream (async with), and after the response in case the body never
+    started (background task). Closing twice is harmless.
+    """
+    async with openai_semaphore:
+        stream = await openai_client.chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=_chat_messages(prompt),
+            prompt_cache_key=_CHAT_PROMPT_CACHE_KEY,
+            stream=True,
+        )
+
+    async def events() -> AsyncIterator[bytes]:
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield b"data: " + msgspec.json.encode(delta) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        background=BackgroundTask(stream.close),
+    )
+
+
+# ---------- Dispatch ----------
+
+def _json_response(body: bytes) -> Response:
+    # Returning a Response directly also skips FastAPI's response_model
+    # re-validation of data we already trust.
+    return Response(content=body, media_type="application/json")
+
+
+def _discard_task(task: asyncio.Task) -> None:
+    """
+    Cancel a speculative task we no longer need.
+    If it already finished with an error, retrieve it so asyncio doesn't log
+    "Task exception was never retrieved".
+    """
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def _handle_prompt(
+    prompt: str,
+    force_mode: Optional[str] = None,
+    stream: bool = False,
+):
+    """
+    Shared dispatch for /ai and /ai/batch:
+    - Step 1: detect intent (unless force_mode override).
+    - Step 2: dispatch to the correct agent (chat vs search_builder).
+    - With stream=True, chat replies are returned as a text/event-stream.
+
+    AIResponse is built with model_construct (no validation): every field
+    comes from values we already validated -- search specs went through
+    SearchSpec's checks on decode, confidences through IntentResult's.
+    """
+    # Optional override, useful for manual testing
+    if force_mode == "chat":
+        if stream:
+            return await call_llm_for_chat_stream(prompt)
+        reply = await call_llm_for_chat(prompt)
+        return AIResponse.model_construct(mode="chat", reply=reply)
+
+    if force_mode == "search_builder":
+        sb_result = await build_search_from_prompt(prompt)
+        return AIResponse.model_construct(
+            mode="search_builder",
+            search_spec=msgspec.to_builtins(sb_result.search_spec),
+            explanation=sb_result.explanation,
+        )
+
+    # --- Normal agentic path: use intent router ---
+    # The search agent only needs the prompt, so start it speculatively
+    # alongside the router; search requests then cost max(intent, search)
+    # instead of intent + search. Dropped if the router says chat.
+    search_task = asyncio.create_task(build_search_from_prompt(prompt))
+    try:
+        intent: IntentResult = await detect_intent(prompt)
+    except BaseException:
+        _discard_task(search_task)
+        raise
+
+    if intent.intent is IntentLabel.SEARCH_BUILDER:
+        sb_result = await search_task
+        return AIResponse.model_construct(
+            mode="search_builder",
+            search_spec=msgspec.to_builtins(sb_result.search_spec),
+            explanation=sb_result.explanation,
+            intent_confidence=intent.confidence,
+        )
+
+    # Default: chat
+    _discard_task(search_task)
+    if stream:
+        return await call_llm_for_chat_stream(prompt)
+    reply = await call_llm_for_chat(prompt)
+    return AIResponse.model_construct(
+        mode="chat",
+        reply=reply,
+        intent_confidence=intent.confidence,
+    )
+
+
 # ---------- Routes ----------
 
+# Caps how many batch prompts are in flight at once (across all /ai/batch
+# calls), so one large batch can't blow through the OpenAI rate limit or
+# starve single-prompt /ai traffic.
+_BATCH_CONCURRENCY = 16
+_BATCH_SEM = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+
 @app.get("/")
 def root():
     return {"status": "ok", "service": "Feasure AI API"}
 
 
 @app.post("/ai", response_model=AIResponse)
-def ai_endpoint(body: AIRequest):
+async def ai_endpoint(body: AIRequest):
     """
     Unified endpoint:
     - Step 1: detect intent (unless force_mode override).
     - Step 2: dispatch to the correct agent (chat vs search_builder).
+    - With stream=true, chat replies are streamed as text/event-stream.
     """
 
     try:
-        # Optional override, useful for manual testing
-        if body.force_mode == "chat":
-            reply = call_llm_for_chat(body.prompt)
-            return AIResponse(mode="chat", reply=reply)
-
-        if body.force_mode == "search_builder":
-            sb_result = build_search_from_prompt(body.prompt)
-            return AIResponse(
-                mode="search_builder",
-                search_spec=sb_result.search_spec,
-                explanation=sb_result.explanation,
-            )
-
-        # --- Normal agentic path: use intent router ---
-        intent: IntentResult = detect_intent(body.prompt)
-
-        if intent.intent == IntentLabel.SEARCH_BUILDER:
-            sb_result = build_search_from_prompt(body.prompt)
-            return AIResponse(
-                mode="search_builder",
-                search_spec=sb_result.search_spec,
-                explanation=sb_result.explanation,
-                intent_confidence=intent.confidence,
-            )
-
-        # Default: chat
-        reply = call_llm_for_chat(body.prompt)
-        return AIResponse(
-            mode="chat",
-            reply=reply,
-            intent_confidence=intent.confidence,
-        )
+        result = await _handle_prompt(body.prompt, body.force_mode, body.stream)
+        if isinstance(result, StreamingResponse):
+            return result
+        return _json_response(result.model_dump_json().encode())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+@app.post("/ai/batch", response_model=List[AIResponse])
+async def ai_batch_endpoint(body: AIBatchRequest):
+    """
+    Batch endpoint: runs every prompt through the same dispatch as /ai
+    concurrently and returns the results in input order.
+    Accepts at most MAX_BATCH_PROMPTS (100) prompts; more is a 422.
+    Streaming isn't supported here. If any prompt fails, the rest are
+    cancelled and the error is returned for the whole batch.
+    """
+
+    async def handle_one(prompt: str):
+        async with _BATCH_SEM:
+            return await _handle_prompt(prompt, body.force_mode)
+
+    tasks = [asyncio.create_task(handle_one(p)) for p in body.prompts]
+    try:
+        results = await asyncio.gather(*tasks)
+        return _json_response(_AI_RESPONSE_LIST.dump_json(results))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # No-op for finished tasks; stops the stragglers if one prompt failed.
+        for task in tasks:
+            _discard_task(task)
+
+
+if __name__ == "__main__":
+    # `python main.py` runs the server on uvloop + httptools (both installed
+    # by uvicorn[standard]). One worker unless WEB_CONCURRENCY is set: the
+    # intent cache, in-flight map, OPENAI_MAX_CONCURRENCY and batch semaphores
+    # are all per worker process, so N workers means N x those limits.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )